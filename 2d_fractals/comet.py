@@ -1,7 +1,14 @@
 import math
+import os
+import sys
 
 import taichi as ti
 
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from fractal_utils.decoupled import DecoupledSimulation  # noqa: E402
+from fractal_utils.telemetry import Telemetry  # noqa: E402
+from fractal_utils.video import VideoWriter  # noqa: E402
+
 ti.init(arch=ti.cuda)
 
 dim = 3
@@ -82,7 +89,13 @@ def render():
             img[p] += color[i]
 
 
-def main():
+def step():
+    generate()
+    for s in range(steps):
+        substep()
+
+
+def initialize():
     inv_m[0] = 0
     x[0].x = +0.5
     x[0].y = -0.01
@@ -90,15 +103,45 @@ def main():
     v[0].y = +0.4
     color[0] = 1
 
+
+def run_decoupled(gui, telemetry, video):
+    # The simulation process steps and renders; this loop only shows the image
+    simulation = DecoupledSimulation(step, ["img"], prepare=render, setup=initialize).start()
+    while gui.running:
+        gui.running = not gui.get_event(gui.ESCAPE)
+        state, _ = simulation.latest()
+        image = state["img"]
+        with telemetry.scope("show"):
+            gui.set_image(image)
+            telemetry.overlay(gui)
+            gui.show()
+        with telemetry.scope("video"):
+            video.write(image)
+        telemetry.frame()
+    simulation.close()
+
+
+def main():
     gui = ti.GUI("Comet", res)
+    telemetry = Telemetry.from_env(kernels=[generate, substep, render])
+    video = VideoWriter.from_env(res, res)
+    if DecoupledSimulation.enabled_from_env():
+        run_decoupled(gui, telemetry, video)
+        return
+    initialize()
     while gui.running:
         gui.running = not gui.get_event(gui.ESCAPE)
-        generate()
-        for s in range(steps):
-            substep()
-        render()
-        gui.set_image(img)
-        gui.show()
+        with telemetry.scope("substep"):
+            step()
+        with telemetry.scope("render"):
+            render()
+        with telemetry.scope("show"):
+            gui.set_image(img)
+            telemetry.overlay(gui)
+            gui.show()
+        with telemetry.scope("video"):
+            video.write(img)
+        telemetry.frame()
 
 
 if __name__ == "__main__":
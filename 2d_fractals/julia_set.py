@@ -1,9 +1,24 @@
+import os
+import sys
+
 import taichi as ti
 
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from fractal_utils.telemetry import Telemetry  # noqa: E402
+from fractal_utils.video import VideoWriter  # noqa: E402
+
 ti.init(arch=ti.cpu)
 
 n = 320
+# Adaptive anti-aliasing: one sample per pixel, then extra jittered samples
+# only where the local contrast exceeds aa_threshold (up to aa_max_samples)
+adaptive_aa = True
+aa_threshold = 0.1
+aa_max_samples = 9
+
 pixels = ti.field(dtype=float, shape=(n * 2, n))
+aa_samples = ti.field(dtype=int, shape=(n * 2, n))
+samples_spent = ti.field(dtype=int, shape=())
 
 
 @ti.func
@@ -11,21 +26,75 @@ def complex_sqr(z):
     return ti.Vector([z[0] ** 2 - z[1] ** 2, z[1] * z[0] * 2])
 
 
+@ti.func
+def shade(i, j, t):
+    c = ti.Vector([-0.8, ti.cos(t) * 0.2])
+    z = ti.Vector([i / n - 1, j / n - 0.5]) * 2
+    iterations = 0
+    while z.norm() < 20 and iterations < 50:
+        z = complex_sqr(z) + c
+        iterations += 1
+    return 1 - iterations * 0.02
+
+
+@ti.func
+def jitter(k):
+    # R2 low-discrepancy sequence, centred on the pixel
+    return ti.math.fract(0.5 + k * ti.Vector([0.7548776662, 0.5698402910])) - 0.5
+
+
 @ti.kernel
 def paint(t: float):
     for i, j in pixels:  # Parallelized over all pixels
-        c = ti.Vector([-0.8, ti.cos(t) * 0.2])
-        z = ti.Vector([i / n - 1, j / n - 0.5]) * 2
-        iterations = 0
-        while z.norm() < 20 and iterations < 50:
-            z = complex_sqr(z) + c
-            iterations += 1
-        pixels[i, j] = 1 - iterations * 0.02
+        pixels[i, j] = shade(i, j, t)
+    samples_spent[None] = n * 2 * n
+
+
+@ti.kernel
+def detect_edges():
+    for i, j in pixels:
+        contrast = 0.0
+        for di, dj in ti.static(ti.ndrange((-1, 2), (-1, 2))):
+            ni = ti.math.clamp(i + di, 0, n * 2 - 1)
+            nj = ti.math.clamp(j + dj, 0, n - 1)
+            contrast = ti.max(contrast, abs(pixels[ni, nj] - pixels[i, j]))
+        aa_samples[i, j] = ti.min(int(contrast / aa_threshold) + 1, aa_max_samples)
+
+
+@ti.kernel
+def refine(t: float):
+    for i, j in pixels:
+        count = aa_samples[i, j]
+        if count > 1:
+            value = pixels[i, j]
+            for k in range(1, count):
+                offset = jitter(k)
+                value += shade(i + offset[0], j + offset[1], t)
+            pixels[i, j] = value / count
+            samples_spent[None] += count - 1
+
+
+def paint_frame(t):
+    """Paint one frame and return the number of samples spent on it."""
+    paint(t)
+    if adaptive_aa:
+        detect_edges()
+        refine(t)
+    return samples_spent[None]
 
 
 gui = ti.GUI("Julia Set ", res=(n * 2, n))
+telemetry = Telemetry.from_env(kernels=[paint, detect_edges, refine])
+video = VideoWriter.from_env(n * 2, n)
 
 for i in range(1000000):
-    paint(i * 0.03)
-    gui.set_image(pixels)
-    gui.show()
+    with telemetry.scope("paint"):
+        spent = paint_frame(i * 0.03)
+    telemetry.record("aa_samples_per_pixel", spent / (n * 2 * n))
+    with telemetry.scope("show"):
+        gui.set_image(pixels)
+        telemetry.overlay(gui, color=0xFF0000)
+        gui.show()
+    with telemetry.scope("video"):
+        video.write(pixels)
+    telemetry.frame()
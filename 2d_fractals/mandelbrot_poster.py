@@ -0,0 +1,11 @@
+# Render a frame of the Mandelbrot zoom as a print-resolution poster, e.g.
+#   python 2d_fractals/mandelbrot_poster.py poster.ppm --width 32768 --height 18432
+import os
+import sys
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fractal_utils import tiles
+
+if __name__ == "__main__":
+    tiles.main("mandelbrot_zoom:render_tile", "Tiled Mandelbrot zoom poster")
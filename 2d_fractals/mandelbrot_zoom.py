@@ -1,9 +1,21 @@
+import os
+import sys
+
 import taichi as ti
-from taichi.math import cmul, dot, log2, vec2, vec3
+from taichi.math import cmul, dot, fract, log2, vec2, vec3
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from fractal_utils.telemetry import Telemetry  # noqa: E402
+from fractal_utils.video import VideoWriter  # noqa: E402
 
 ti.init(arch=ti.gpu)
 
 MAXITERS = 100
+# Adaptive anti-aliasing: one sample per pixel, then extra jittered samples
+# only where the local contrast exceeds AA_THRESHOLD (up to AA_MAX_SAMPLES)
+ADAPTIVE_AA = True
+AA_THRESHOLD = 0.1
+AA_MAX_SAMPLES = 9
 try:
     import pyautogui
 
@@ -11,12 +23,14 @@ try:
     width -= 100
     height -= 80
     print(f"Detected screen resolution: {width}x{height}")
-except ImportError:
-    print("pyautogui not found. Using a default widescreen resolution.")
+except Exception:  # not installed, or no display to query (e.g. headless)
+    print("pyautogui not available. Using a default widescreen resolution.")
     # width, height = 1920, 1080
     width, height = 1800, 1000
 
 pixels = ti.Vector.field(3, ti.f32, shape=(width, height))
+aa_samples = ti.field(ti.i32, shape=(width, height))
+samples_spent = ti.field(ti.i32, shape=())
 
 
 @ti.func
@@ -31,35 +45,118 @@ def setcolor(z, i):
     return col
 
 
-@ti.kernel
-def render(time: ti.f32):
+@ti.func
+def shade(i, j, res_y, zoo, ca, sa):
+    c = 2.0 * vec2(i, j) / res_y - vec2(1)
+    # c *= 1.16
+    xy = vec2(c.x * ca - c.y * sa, c.x * sa + c.y * ca)
+    c = vec2(-0.745, 0.186) + xy * zoo
+    z = vec2(0.0)
+    count = 0.0
+    while count < MAXITERS and dot(z, z) < 50:
+        z = cmul(z, z) + c
+        count += 1.0
+
+    col = vec3(0.0)
+    if count < MAXITERS:
+        col = setcolor(z, count)
+    return col
+
+
+@ti.func
+def jitter(k):
+    # R2 low-discrepancy sequence, centred on the pixel
+    return fract(0.5 + k * vec2(0.7548776662, 0.5698402910)) - 0.5
+
+
+@ti.func
+def luminance(col):
+    return dot(col, vec3(0.299, 0.587, 0.114))
+
+
+@ti.func
+def camera(time):
     zoo = 0.64 + 0.36 * ti.cos(0.02 * time)
     zoo = ti.pow(zoo, 8.0)
     ca = ti.cos(0.15 * (1.0 - zoo) * time)
     sa = ti.sin(0.15 * (1.0 - zoo) * time)
+    return zoo, ca, sa
+
+
+@ti.kernel
+def render(time: ti.f32):
+    zoo, ca, sa = camera(time)
     for i, j in pixels:
-        c = 2.0 * vec2(i, j) / height - vec2(1)
-        # c *= 1.16
-        xy = vec2(c.x * ca - c.y * sa, c.x * sa + c.y * ca)
-        c = vec2(-0.745, 0.186) + xy * zoo
-        z = vec2(0.0)
-        count = 0.0
-        while count < MAXITERS and dot(z, z) < 50:
-            z = cmul(z, z) + c
-            count += 1.0
-
-        if count == MAXITERS:
-            pixels[i, j] = [0, 0, 0]
-        else:
-            pixels[i, j] = setcolor(z, count)
+        pixels[i, j] = shade(i, j, height, zoo, ca, sa)
+    samples_spent[None] = width * height
+
+
+@ti.kernel
+def detect_edges():
+    for i, j in pixels:
+        lum = luminance(pixels[i, j])
+        contrast = 0.0
+        for di, dj in ti.static(ti.ndrange((-1, 2), (-1, 2))):
+            ni = ti.math.clamp(i + di, 0, width - 1)
+            nj = ti.math.clamp(j + dj, 0, height - 1)
+            contrast = ti.max(contrast, abs(luminance(pixels[ni, nj]) - lum))
+        aa_samples[i, j] = ti.min(int(contrast / AA_THRESHOLD) + 1, AA_MAX_SAMPLES)
+
+
+@ti.kernel
+def refine(time: ti.f32):
+    zoo, ca, sa = camera(time)
+    for i, j in pixels:
+        n = aa_samples[i, j]
+        if n > 1:
+            col = pixels[i, j]
+            for k in range(1, n):
+                offset = jitter(k)
+                col += shade(i + offset.x, j + offset.y, height, zoo, ca, sa)
+            pixels[i, j] = col / n
+            samples_spent[None] += n - 1
+
+
+@ti.kernel
+def render_tile(
+    tile: ti.types.ndarray(dtype=vec3, ndim=2),
+    x0: ti.i32,
+    y0: ti.i32,
+    res_x: ti.i32,
+    res_y: ti.i32,
+    time: ti.f32,
+):
+    # One tile of an arbitrarily large render, for fractal_utils.tiles.
+    # The view is framed by the poster's own height, like the window's.
+    zoo, ca, sa = camera(time)
+    for i, j in tile:
+        tile[i, j] = shade(x0 + i, y0 + j, res_y, zoo, ca, sa)
+
+
+def render_frame(time):
+    """Render one frame and return the number of samples spent on it."""
+    render(time)
+    if ADAPTIVE_AA:
+        detect_edges()
+        refine(time)
+    return samples_spent[None]
 
 
 def main():
     gui = ti.GUI("Mandelbrot set zoom", res=(width, height))
+    telemetry = Telemetry.from_env(kernels=[render, detect_edges, refine])
+    video = VideoWriter.from_env(width, height)
     for i in range(100000):
-        render(i * 0.2)  # Speed
-        gui.set_image(pixels)
-        gui.show()
+        with telemetry.scope("render"):
+            spent = render_frame(i * 0.2)  # Speed
+        telemetry.record("aa_samples_per_pixel", spent / (width * height))
+        with telemetry.scope("show"):
+            gui.set_image(pixels)
+            telemetry.overlay(gui)
+            gui.show()
+        with telemetry.scope("video"):
+            video.write(pixels)
+        telemetry.frame()
 
 
 if __name__ == "__main__":
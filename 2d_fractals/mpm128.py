@@ -1,5 +1,13 @@
+import os
+import sys
+
 import taichi as ti
 
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from fractal_utils.decoupled import DecoupledSimulation  # noqa: E402
+from fractal_utils.telemetry import Telemetry  # noqa: E402
+from fractal_utils.video import VideoWriter  # noqa: E402
+
 ti.init(arch=ti.gpu)  # Try to run on GPU
 
 quality = 1  # Use a larger value for higher-res simulations
@@ -123,45 +131,86 @@ def reset():
         C[i] = ti.Matrix.zero(float, 2, 2)
 
 
-print(
-    "[Hint] Use WSAD/arrow keys to control gravity. Use left/right mouse buttons to attract/repel. Press R to reset."
-)
-gui = ti.GUI("Taichi MLS-MPM-128", res=512, background_color=0x112F41, fullscreen=True)
-reset()
-gravity[None] = [0, -1]
-
-for frame in range(20000):
-    if gui.get_event(ti.GUI.PRESS):
-        if gui.event.key == "r":
-            reset()
-        elif gui.event.key in [ti.GUI.ESCAPE, ti.GUI.EXIT]:
-            break
-    if gui.event is not None:
-        gravity[None] = [0, 0]  # if had any event
-    if gui.is_pressed(ti.GUI.LEFT, "a"):
-        gravity[None][0] = -1
-    if gui.is_pressed(ti.GUI.RIGHT, "d"):
-        gravity[None][0] = 1
-    if gui.is_pressed(ti.GUI.UP, "w"):
-        gravity[None][1] = 1
-    if gui.is_pressed(ti.GUI.DOWN, "s"):
-        gravity[None][1] = -1
-    mouse = gui.get_cursor_pos()
-    gui.circle((mouse[0], mouse[1]), color=0x336699, radius=15)
-    attractor_pos[None] = [mouse[0], mouse[1]]
-    attractor_strength[None] = 0
-    if gui.is_pressed(ti.GUI.LMB):
-        attractor_strength[None] = 1
-    if gui.is_pressed(ti.GUI.RMB):
-        attractor_strength[None] = -1
+def step():
     for s in range(int(2e-3 // dt)):
         substep()
-    gui.circles(
-        x.to_numpy(),
-        radius=1.5,
-        palette=[0x068587, 0xED553B, 0xEEEEF0],
-        palette_indices=material,
+
+
+def set_controls(g, attractor, strength):
+    gravity[None] = g
+    attractor_pos[None] = attractor
+    attractor_strength[None] = strength
+
+
+def main():
+    print(
+        "[Hint] Use WSAD/arrow keys to control gravity. Use left/right mouse buttons to attract/repel. Press R to reset."
     )
+    gui = ti.GUI("Taichi MLS-MPM-128", res=512, background_color=0x112F41, fullscreen=True)
+    telemetry = Telemetry.from_env(kernels=[substep])
+    video = VideoWriter.from_env(*gui.res)
+    # Set DECOUPLED=1 to step the simulation in its own process; this loop
+    # then only draws and forwards input to it
+    simulation = None
+    if DecoupledSimulation.enabled_from_env():
+        simulation = DecoupledSimulation(step, ["x", "material"], setup=reset).start()
+    else:
+        reset()
+
+    def send(function, *args):
+        if simulation is None:
+            function(*args)
+        else:
+            simulation.post(function, *args)
+
+    g = [0, -1]
+    for frame in range(20000):
+        if gui.get_event(ti.GUI.PRESS):
+            if gui.event.key == "r":
+                send(reset)
+            elif gui.event.key in [ti.GUI.ESCAPE, ti.GUI.EXIT]:
+                break
+        if gui.event is not None:
+            g = [0, 0]  # if had any event
+        if gui.is_pressed(ti.GUI.LEFT, "a"):
+            g[0] = -1
+        if gui.is_pressed(ti.GUI.RIGHT, "d"):
+            g[0] = 1
+        if gui.is_pressed(ti.GUI.UP, "w"):
+            g[1] = 1
+        if gui.is_pressed(ti.GUI.DOWN, "s"):
+            g[1] = -1
+        mouse = gui.get_cursor_pos()
+        gui.circle((mouse[0], mouse[1]), color=0x336699, radius=15)
+        strength = 0
+        if gui.is_pressed(ti.GUI.LMB):
+            strength = 1
+        if gui.is_pressed(ti.GUI.RMB):
+            strength = -1
+        send(set_controls, tuple(g), [mouse[0], mouse[1]], strength)
+        if simulation is None:
+            with telemetry.scope("substep"):
+                step()
+            with telemetry.scope("to_numpy"):
+                positions, materials = x.to_numpy(), material.to_numpy()
+        else:
+            state, _ = simulation.latest()
+            positions, materials = state["x"], state["material"]
+        with telemetry.scope("show"):
+            gui.circles(
+                positions,
+                radius=1.5,
+                palette=[0x068587, 0xED553B, 0xEEEEF0],
+                palette_indices=materials,
+            )
+            # Set VIDEO=mpm128.mp4 (or .y4m) to record the simulation
+            video.write(gui)
+            telemetry.overlay(gui)
+            gui.show()
+        telemetry.frame()
+    if simulation is not None:
+        simulation.close()
+
 
-    # Change to gui.show(f'{frame:06d}.png') to write images to disk
-    gui.show()
+if __name__ == "__main__":
+    main()
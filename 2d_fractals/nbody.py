@@ -1,8 +1,15 @@
 # Authored by Tiantian Liu, Taichi Graphics.
 import math
+import os
+import sys
 
 import taichi as ti
 
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from fractal_utils.decoupled import DecoupledSimulation  # noqa: E402
+from fractal_utils.telemetry import Telemetry  # noqa: E402
+from fractal_utils.video import VideoWriter  # noqa: E402
+
 ti.init(arch=ti.cpu)
 
 # global control
@@ -81,9 +88,49 @@ def update():
         pos[i] += dt * vel[i]
 
 
+def step():
+    if paused[None]:
+        return False
+    for i in range(substepping):
+        compute_force()
+        update()
+    return True
+
+
+def toggle_pause():
+    paused[None] = not paused[None]
+
+
+def run_decoupled(gui, telemetry, video):
+    # The simulation process steps and reads back; this loop draws and forwards input
+    simulation = DecoupledSimulation(step, ["pos"], setup=initialize).start()
+    while gui.running:
+        for e in gui.get_events(ti.GUI.PRESS):
+            if e.key in [ti.GUI.ESCAPE, ti.GUI.EXIT]:
+                exit()
+            elif e.key == "r":
+                simulation.post(initialize)
+            elif e.key == ti.GUI.SPACE:
+                simulation.post(toggle_pause)
+
+        state, _ = simulation.latest()
+        positions = state["pos"]
+        with telemetry.scope("show"):
+            gui.circles(positions, color=0xFFFFFF, radius=planet_radius)
+            video.write(gui)
+            telemetry.overlay(gui)
+            gui.show()
+        telemetry.frame()
+
+
 def main():
     gui = ti.GUI("N-body problem", (800, 800))
+    telemetry = Telemetry.from_env(kernels=[compute_force, update])
+    video = VideoWriter.from_env(*gui.res)
 
+    if DecoupledSimulation.enabled_from_env():
+        run_decoupled(gui, telemetry, video)
+        return
     initialize()
     while gui.running:
         for e in gui.get_events(ti.GUI.PRESS):
@@ -92,15 +139,19 @@ def main():
             elif e.key == "r":
                 initialize()
             elif e.key == ti.GUI.SPACE:
-                paused[None] = not paused[None]
-
-        if not paused[None]:
-            for i in range(substepping):
-                compute_force()
-                update()
-
-        gui.circles(pos.to_numpy(), color=0xFFFFFF, radius=planet_radius)
-        gui.show()
+                toggle_pause()
+
+        with telemetry.scope("step"):
+            step()
+
+        with telemetry.scope("to_numpy"):
+            positions = pos.to_numpy()
+        with telemetry.scope("show"):
+            gui.circles(positions, color=0xFFFFFF, radius=planet_radius)
+            video.write(gui)
+            telemetry.overlay(gui)
+            gui.show()
+        telemetry.frame()
 
 
 if __name__ == "__main__":
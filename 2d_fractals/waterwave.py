@@ -1,8 +1,16 @@
 # Water wave effect partially based on shallow water equations
 # https://en.wikipedia.org/wiki/Shallow_water_equations#Non-conservative_form
 
+import os
+import sys
+
 import taichi as ti
 
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from fractal_utils.decoupled import DecoupledSimulation  # noqa: E402
+from fractal_utils.telemetry import Telemetry  # noqa: E402
+from fractal_utils.video import VideoWriter  # noqa: E402
+
 ti.init(arch=ti.gpu)
 
 try:
@@ -92,11 +100,42 @@ def visualize_wave():
         pixels[i, j] = (1 - brightness) * color + brightness * light_color
 
 
+def run_decoupled(gui, telemetry, video):
+    # The simulation process updates and shades; this loop shows and forwards input
+    simulation = DecoupledSimulation(
+        update, ["pixels"], prepare=visualize_wave, setup=reset
+    ).start()
+    while gui.running:
+        for e in gui.get_events(ti.GUI.PRESS):
+            if e.key in [ti.GUI.ESCAPE, ti.GUI.EXIT]:
+                gui.running = False
+            elif e.key == "r":
+                simulation.post(reset)
+            elif e.key == ti.GUI.LMB:
+                x, y = e.pos
+                simulation.post(create_wave, 3, x * shape[0], y * shape[1])
+        state, _ = simulation.latest()
+        image = state["pixels"]
+        with telemetry.scope("show"):
+            gui.set_image(image)
+            telemetry.overlay(gui)
+            gui.show()
+        with telemetry.scope("video"):
+            video.write(image)
+        telemetry.frame()
+    simulation.close()
+
+
 def main():
     print("[Hint] click on the window to create waves")
 
     reset()
     gui = ti.GUI("Water Wave", shape)
+    telemetry = Telemetry.from_env(kernels=[update, visualize_wave])
+    video = VideoWriter.from_env(*shape)
+    if DecoupledSimulation.enabled_from_env():
+        run_decoupled(gui, telemetry, video)
+        return
     while gui.running:
         for e in gui.get_events(ti.GUI.PRESS):
             if e.key in [ti.GUI.ESCAPE, ti.GUI.EXIT]:
@@ -106,10 +145,17 @@ def main():
             elif e.key == ti.GUI.LMB:
                 x, y = e.pos
                 create_wave(3, x * shape[0], y * shape[1])
-        update()
-        visualize_wave()
-        gui.set_image(pixels)
-        gui.show()
+        with telemetry.scope("update"):
+            update()
+        with telemetry.scope("visualize"):
+            visualize_wave()
+        with telemetry.scope("show"):
+            gui.set_image(pixels)
+            telemetry.overlay(gui)
+            gui.show()
+        with telemetry.scope("video"):
+            video.write(pixels)
+        telemetry.frame()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,175 @@
+"""Run a scene's simulation in its own process, decoupled from the display.
+
+A Taichi kernel launch holds the GIL until the kernel returns, so a
+simulation thread would freeze the window for the length of every launch.
+Instead a child process (started with ``spawn``, so it re-imports the scene
+script without running its ``__main__`` block) runs the scene's ``setup``
+once and then calls ``step`` in a loop at its own rate.
+
+The fields the display needs are exchanged through two buffers in shared
+memory. The child reads the fields back into the back buffer only when the
+display has taken the previous frame and the state has changed since, then
+swaps front and back under a short lock, so no readback is spent on frames
+that would never be shown. The display draws straight from the front
+buffer, which the child does not touch until the display asks for the next
+frame.
+
+Input reaches the simulation through a ``multiprocessing.Queue``, whose
+``put`` hands the command to a feeder thread and returns at once, so the
+display never waits on the simulation. Decoupling is off unless
+``DECOUPLED`` is set:
+
+    DECOUPLED=1 python 2d_fractals/nbody.py
+"""
+
+import atexit
+import multiprocessing
+import os
+import queue
+import sys
+import time
+
+import numpy as np
+import taichi as ti
+
+# Slots of the shared control array, guarded by its lock
+_FRONT, _SEQUENCE, _REQUESTED, _STEPS = range(4)
+
+
+@ti.kernel
+def _read_back(src: ti.template(), dst: ti.types.ndarray(), n: ti.template()):
+    for I in ti.grouped(src):
+        if ti.static(n == 0):
+            dst[I] = src[I]
+        else:
+            for c in ti.static(range(n)):
+                dst[I, c] = src[I][c]
+
+
+def _buffers(layout):
+    # Two NumPy views per field onto its shared array
+    return [
+        {
+            name: np.frombuffer(raw, dtype).reshape((2,) + shape)[k]
+            for name, raw, shape, dtype in layout
+        }
+        for k in range(2)
+    ]
+
+
+def _simulate(step, prepare, setup, layout, control, ready, stop, commands):
+    module = sys.modules[step.__module__]
+    fields = [(name, getattr(module, name)) for name, _, _, _ in layout]
+    buffers = _buffers(layout)
+    if setup is not None:
+        setup()
+    changed = True
+    while not stop.is_set():
+        while True:
+            try:
+                function, args = commands.get_nowait()
+            except queue.Empty:
+                break
+            function(*args)
+            changed = True
+        stepped = step() is not False
+        changed = changed or stepped
+        with control.get_lock():
+            requested = control[_REQUESTED]
+            control[_STEPS] += stepped
+        if changed and requested:
+            back = 1 - control[_FRONT]  # only this process writes _FRONT
+            if prepare is not None:
+                prepare()
+            for name, field in fields:
+                _read_back(field, buffers[back][name], getattr(field, "n", 0))
+            ti.sync()
+            with control.get_lock():
+                control[_FRONT] = back
+                control[_SEQUENCE] += 1
+                control[_REQUESTED] = 0
+            ready.set()
+            changed = False
+        elif not stepped:
+            time.sleep(0.005)  # paused: wait for a command or a request
+
+
+class DecoupledSimulation:
+    """Step a scene's simulation in a child process and show its latest state.
+
+    ``step()`` advances the simulation by one display frame's worth of work;
+    returning ``False`` (e.g. while paused) means the state did not change.
+    ``fields`` names the module-level Taichi fields the display reads, and
+    ``prepare()``, if given, runs before they are read back (e.g. to shade
+    an image). ``setup()`` initialises the state in the child. All of them,
+    and the functions passed to ``post()``, must be module-level functions
+    of the scene script, as they run in the child.
+    """
+
+    def __init__(self, step, fields, prepare=None, setup=None):
+        module = sys.modules[step.__module__]
+        context = multiprocessing.get_context("spawn")
+        layout = []
+        for name in fields:
+            template = getattr(module, name).to_numpy()
+            raw = context.RawArray(np.ctypeslib.as_ctypes_type(template.dtype), 2 * template.size)
+            layout.append((name, raw, template.shape, template.dtype))
+        self._buffers = _buffers(layout)
+        self._control = context.Array("q", 4)
+        self._control[_REQUESTED] = 1  # the first snapshot
+        self._ready = context.Event()
+        self._stop = context.Event()
+        self._commands = context.Queue()
+        self._process = context.Process(
+            target=_simulate,
+            args=(step, prepare, setup, layout, self._control, self._ready, self._stop,
+                  self._commands),
+            daemon=True,
+        )
+        self.shown = 0
+
+    @staticmethod
+    def enabled_from_env():
+        return os.environ.get("DECOUPLED", "") not in ("", "0")
+
+    def start(self):
+        self._start = time.perf_counter()
+        self._process.start()
+        atexit.register(self.close)
+        return self
+
+    def post(self, function, *args):
+        """Run ``function(*args)`` in the simulation process before its next step."""
+        self._commands.put((function, args))
+
+    def latest(self):
+        """The newest state as ``{field name: array}`` and its snapshot number.
+
+        The arrays stay valid until the next call, which also asks the
+        simulation for a fresh snapshot.
+        """
+        while not self._ready.wait(0.1):
+            if not self._process.is_alive():
+                raise RuntimeError("the simulation process exited before its first frame")
+        if not self._process.is_alive():
+            raise RuntimeError("the simulation process exited")
+        with self._control.get_lock():
+            front = self._control[_FRONT]
+            sequence = self._control[_SEQUENCE]
+            self._control[_REQUESTED] = 1
+        self.shown += 1
+        return self._buffers[front], sequence
+
+    def close(self):
+        if self._stop.is_set():
+            return
+        self._stop.set()
+        self._process.join(5.0)
+        if self._process.is_alive():
+            self._process.terminate()
+        elapsed = time.perf_counter() - self._start
+        steps, snapshots = self._control[_STEPS], self._control[_SEQUENCE]
+        print(
+            f"[Decoupled] {steps} simulation steps ({steps / elapsed:.1f}/s), "
+            f"{snapshots} read back, {self.shown} frames displayed ({self.shown / elapsed:.1f}/s)"
+        )
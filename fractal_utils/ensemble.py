@@ -0,0 +1,37 @@
+"""Helpers for ensembles: many independent simulations batched in one field.
+
+Ensemble fields carry a leading member dimension, so a single kernel launch
+advances every member. Members need their own reproducible random streams,
+which ``ti.random()`` cannot provide, so initial conditions are drawn from a
+counter-based hash of (member seed, element, draw) instead.
+"""
+
+import time
+
+import taichi as ti
+
+
+@ti.func
+def pcg_hash(v):
+    # PCG-RXS-M-XS output permutation of a 32-bit state
+    state = v * ti.u32(747796405) + ti.u32(2891336453)
+    word = ((state >> ((state >> 28) + ti.u32(4))) ^ state) * ti.u32(277803737)
+    return (word >> 22) ^ word
+
+
+@ti.func
+def member_random(seed, i, k):
+    # Uniform [0, 1) sample number k for element i of the member with `seed`
+    bits = pcg_hash(pcg_hash(ti.cast(seed, ti.u32)) + ti.cast(i, ti.u32) * ti.u32(8) + ti.cast(k, ti.u32))
+    return ti.cast(bits >> 8, ti.f32) / 16777216.0
+
+
+def throughput(step, members, steps):
+    """Member-steps per second of ``steps`` calls to ``step()``."""
+    step()  # compile and warm up
+    ti.sync()
+    start = time.perf_counter()
+    for _ in range(steps):
+        step()
+    ti.sync()
+    return members * steps / (time.perf_counter() - start)
@@ -0,0 +1,220 @@
+"""Frame-time and per-phase telemetry for the scene loops.
+
+Telemetry is off unless the ``TELEMETRY`` environment variable is set:
+
+- ``TELEMETRY=1`` prints rolling percentiles and draws an on-screen overlay
+- ``TELEMETRY=run.jsonl`` or ``TELEMETRY=run.csv`` exports them to a file
+
+Run with ``TI_KERNEL_PROFILER=1`` as well to add Taichi's device time for
+each kernel passed as ``kernels``.
+When disabled, ``scope()`` returns a shared no-op context manager and the
+other methods return immediately.
+"""
+
+import atexit
+import contextlib
+import csv
+import json
+import os
+import time
+from collections import defaultdict, deque
+
+import numpy as np
+import taichi as ti
+
+_NULL_SCOPE = contextlib.nullcontext()
+
+
+class _Scope:
+    __slots__ = ("telemetry", "name", "start")
+
+    def __init__(self, telemetry, name):
+        self.telemetry = telemetry
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        if self.telemetry.sync:
+            ti.sync()  # attribute asynchronous kernel launches to this phase
+        self.telemetry._phase_time[self.name] += time.perf_counter() - self.start
+        return False
+
+
+class Telemetry:
+    """Scoped phase timers, rolling frame-time percentiles and periodic export.
+
+    Wrap each phase of a scene loop in ``with telemetry.scope(name):`` and call
+    ``telemetry.frame()`` once per loop iteration.
+    """
+
+    def __init__(self, enabled=False, export=None, window=300, interval=2.0, sync=True,
+                 kernels=()):
+        self.enabled = enabled
+        self.export = export
+        self.kernels = [kernel.__name__ for kernel in kernels]
+        self.interval = interval
+        self.sync = sync
+        self._frame_ms = deque(maxlen=window)
+        self._phase_ms = defaultdict(lambda: deque(maxlen=window))
+        self._phase_time = defaultdict(float)
+        self._values = defaultdict(lambda: deque(maxlen=window))
+        self._last_frame = None
+        self._last_export = time.perf_counter()
+        self._frames_since_export = 0
+        self._csv_fields = None
+        self._kernel_totals = {}
+        self._overlay = ""
+        if enabled:
+            atexit.register(self.close)
+
+    @classmethod
+    def from_env(cls, **kwargs):
+        setting = os.environ.get("TELEMETRY", "")
+        if setting in ("", "0"):
+            return cls(enabled=False, **kwargs)
+        export = None if setting == "1" else setting
+        return cls(enabled=True, export=export, **kwargs)
+
+    def scope(self, name):
+        """Time the enclosed block as phase ``name`` of the current frame."""
+        if not self.enabled:
+            return _NULL_SCOPE
+        return _Scope(self, name)
+
+    def record(self, name, value):
+        """Add a sample of a per-frame statistic, reported as its rolling mean."""
+        if not self.enabled:
+            return
+        self._values[name].append(value)
+
+    def frame(self):
+        """Close the current frame and export a summary every ``interval`` s."""
+        if not self.enabled:
+            return
+        now = time.perf_counter()
+        if self._last_frame is not None:
+            self._frame_ms.append((now - self._last_frame) * 1000.0)
+        self._last_frame = now
+        for name, seconds in self._phase_time.items():
+            self._phase_ms[name].append(seconds * 1000.0)
+        self._phase_time.clear()
+        self._frames_since_export += 1
+        if now - self._last_export >= self.interval:
+            self._write(self.summary(now - self._last_export))
+            self._last_export = now
+            self._frames_since_export = 0
+
+    def percentiles(self, samples):
+        if not samples:
+            return {"p50": 0.0, "p95": 0.0, "p99": 0.0}
+        p50, p95, p99 = np.percentile(np.asarray(samples), [50, 95, 99])
+        return {"p50": float(p50), "p95": float(p95), "p99": float(p99)}
+
+    def summary(self, elapsed=None):
+        """Rolling percentiles (in ms) of the frame and of every phase."""
+        record = {
+            "time": time.time(),
+            "frames": self._frames_since_export,
+            "frame_ms": self.percentiles(self._frame_ms),
+            "phases_ms": {
+                name: self.percentiles(samples)
+                for name, samples in self._phase_ms.items()
+            },
+        }
+        if elapsed:
+            record["fps"] = self._frames_since_export / elapsed
+        if self._values:
+            record["values"] = {
+                name: float(np.mean(samples)) for name, samples in self._values.items()
+            }
+        kernels = self._kernel_times()
+        if kernels:
+            record["kernels_ms"] = kernels
+        frame = record["frame_ms"]
+        self._overlay = f"frame p50 {frame['p50']:.1f} p95 {frame['p95']:.1f} p99 {frame['p99']:.1f} ms"
+        for name, stats in record["phases_ms"].items():
+            self._overlay += f"\n{name} p50 {stats['p50']:.2f} ms"
+        for name, value in record.get("values", {}).items():
+            self._overlay += f"\n{name} {value:.2f}"
+        return record
+
+    def overlay(self, gui, color=0xFFFFFF):
+        """Draw the latest summary with ``gui.text``; call before ``gui.show()``."""
+        if not self.enabled:
+            return
+        for row, line in enumerate(self._overlay.splitlines()):
+            gui.text(line, pos=(0.01, 0.99 - 0.03 * row), font_size=16, color=color)
+
+    def close(self):
+        if not self.enabled:
+            return
+        if self._frames_since_export:
+            self._write(self.summary(time.perf_counter() - self._last_export))
+        self.enabled = False
+        if self._kernel_profiler_on():
+            ti.profiler.print_kernel_profiler_info()
+
+    def _kernel_profiler_on(self):
+        return ti.profiler.kernel_profiler.get_default_kernel_profiler().get_kernel_profiler_mode()
+
+    def _kernel_times(self):
+        """Device time (ms) per tracked kernel since the last export."""
+        if not self.kernels or not self._kernel_profiler_on():
+            return {}
+        totals = {}
+        for name in self.kernels:
+            info = ti.profiler.query_kernel_profiler_info(name)
+            totals[name] = info.counter * info.avg
+        kernels = {
+            name: total - self._kernel_totals.get(name, 0.0)
+            for name, total in totals.items()
+        }
+        self._kernel_totals = totals
+        return kernels
+
+    def _write(self, record):
+        if self.export is None:
+            frame = record["frame_ms"]
+            print(
+                f"[Telemetry] {record.get('fps', 0.0):.1f} fps, frame ms "
+                f"p50 {frame['p50']:.2f} p95 {frame['p95']:.2f} p99 {frame['p99']:.2f}; "
+                + ", ".join(
+                    [
+                        f"{name} p50 {stats['p50']:.2f}"
+                        for name, stats in record["phases_ms"].items()
+                    ]
+                    + [f"{name} {value:.2f}" for name, value in record.get("values", {}).items()]
+                )
+            )
+        elif self.export.endswith(".csv"):
+            row = {"time": record["time"], "frames": record["frames"], "fps": record.get("fps")}
+            for key, value in record["frame_ms"].items():
+                row[f"frame_{key}_ms"] = value
+            for name, stats in record["phases_ms"].items():
+                for key, value in stats.items():
+                    row[f"{name}_{key}_ms"] = value
+            for name, value in record.get("kernels_ms", {}).items():
+                row[f"kernel_{name}_ms"] = value
+            row.update(record.get("values", {}))
+            rows = [row]
+            if self._csv_fields is None:
+                self._csv_fields = list(row)
+            elif any(name not in self._csv_fields for name in row):
+                # A phase or kernel appeared: rewrite the file under a wider header
+                with open(self.export, newline="") as f:
+                    rows = list(csv.DictReader(f)) + rows
+                self._csv_fields += [name for name in row if name not in self._csv_fields]
+            else:
+                with open(self.export, "a", newline="") as f:
+                    csv.DictWriter(f, self._csv_fields).writerow(row)
+                return
+            with open(self.export, "w", newline="") as f:
+                writer = csv.DictWriter(f, self._csv_fields)
+                writer.writeheader()
+                writer.writerows(rows)
+        else:
+            with open(self.export, "a") as f:
+                f.write(json.dumps(record) + "\n")
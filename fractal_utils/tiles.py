@@ -0,0 +1,178 @@
+"""Tiled, multi-process rendering into a memory-mapped image file.
+
+The output is a binary PPM whose pixel payload is memory-mapped by every
+worker, so renders far larger than RAM (16k-32k posters) stream straight to
+disk. Each worker process runs its own CPU Taichi runtime and renders whole
+tiles through a scene's ``render_tile`` kernel. Completed tiles are recorded
+in a ``.tiles`` file next to the output, together with the scene and
+settings they were rendered with, and a rerun with the same settings resumes
+where an interrupted render stopped.
+"""
+
+import argparse
+import importlib
+import json
+import multiprocessing
+import os
+import platform
+import time
+
+import numpy as np
+
+_worker = {}
+
+
+def _ppm_header(width, height):
+    return f"P6\n{width} {height}\n255\n".encode("ascii")
+
+
+def _tiles(width, height, tile_size):
+    return [
+        (x0, y0, min(tile_size, width - x0), min(tile_size, height - y0))
+        for y0 in range(0, height, tile_size)
+        for x0 in range(0, width, tile_size)
+    ]
+
+
+def _open_pixels(path, width, height, mode):
+    return np.memmap(
+        path,
+        dtype=np.uint8,
+        mode=mode,
+        offset=len(_ppm_header(width, height)),
+        shape=(height, width, 3),
+    )
+
+
+def _prepare_output(path, width, height, settings):
+    """Create the output file, or reuse it and its progress log on resume.
+
+    The first line of the progress log records ``settings``; completed tile
+    indices follow. Resuming with different settings would mix tiles of
+    different layouts or frames, so it is refused.
+    """
+    header = _ppm_header(width, height)
+    size = len(header) + width * height * 3
+    progress = path + ".tiles"
+    if os.path.exists(path) and os.path.exists(progress):
+        with open(progress) as log:
+            first = log.readline()
+            done = {int(line) for line in log if line.strip()}
+        if first.strip() and json.loads(first) != settings:
+            raise ValueError(
+                f"{path} was started with {first.strip()}, not {json.dumps(settings)}; "
+                "delete it and its .tiles file or choose another output to start over"
+            )
+        with open(path, "rb") as f:
+            if f.read(len(header)) == header and os.path.getsize(path) == size:
+                return done
+    with open(path, "wb") as f:
+        f.write(header)
+        f.truncate(size)  # sparse on most filesystems
+    with open(progress, "w") as log:
+        log.write(json.dumps(settings) + "\n")
+    return set()
+
+
+def _cpu_arch():
+    return "arm64" if platform.machine().lower() in ("arm64", "aarch64") else "x64"
+
+
+def _init_worker(module, function, path, width, height, threads):
+    # Must run before the scene module calls ti.init(), which reads these
+    os.environ["TI_ARCH"] = _cpu_arch()
+    os.environ["TI_CPU_MAX_NUM_THREADS"] = str(threads)
+    _worker["render_tile"] = getattr(importlib.import_module(module), function)
+    _worker["pixels"] = _open_pixels(path, width, height, "r+")
+
+
+def _render_tile(job):
+    index, (x0, y0, w, h), width, height, args = job
+    tile = np.empty((w, h, 3), dtype=np.float32)
+    _worker["render_tile"](tile, x0, y0, width, height, *args)
+    # Taichi tiles are (x, y) with y up; image rows run top to bottom
+    rgb = np.clip(tile.transpose(1, 0, 2)[::-1] * 255.0 + 0.5, 0, 255)
+    pixels = _worker["pixels"]
+    pixels[height - y0 - h : height - y0, x0 : x0 + w] = rgb.astype(np.uint8)
+    pixels.flush()
+    return index
+
+
+def render_tiled(
+    path,
+    scene,
+    width,
+    height,
+    args=(),
+    tile_size=512,
+    workers=None,
+    threads_per_worker=1,
+):
+    """Render ``scene`` at ``width`` x ``height`` into the PPM file ``path``.
+
+    ``scene`` names the tile kernel as ``"module:function"``. It is imported
+    only inside the workers, so the parent never starts a Taichi runtime. The
+    kernel is called as ``render_tile(tile, x0, y0, width, height, *args)``
+    with a float32 ``(w, h, 3)`` array to fill with RGB values in [0, 1].
+    """
+    module, function = scene.split(":")
+    workers = workers or max(1, (os.cpu_count() or 1) // threads_per_worker)
+    settings = {
+        "scene": scene,
+        "width": width,
+        "height": height,
+        "tile_size": tile_size,
+        "args": list(args),
+    }
+    done = _prepare_output(path, width, height, settings)
+    tiles = _tiles(width, height, tile_size)
+    jobs = [
+        (index, tile, width, height, tuple(args))
+        for index, tile in enumerate(tiles)
+        if index not in done
+    ]
+    print(
+        f"[Tiles] {len(tiles)} tiles of {tile_size}px, {len(done)} already done, "
+        f"{workers} workers x {threads_per_worker} threads"
+    )
+
+    start = time.perf_counter()
+    context = multiprocessing.get_context("spawn")
+    initargs = (module, function, path, width, height, threads_per_worker)
+    with context.Pool(workers, _init_worker, initargs) as pool, open(
+        path + ".tiles", "a"
+    ) as progress:
+        rendered = 0
+        for count, index in enumerate(pool.imap_unordered(_render_tile, jobs), 1):
+            progress.write(f"{index}\n")
+            progress.flush()
+            rendered += tiles[index][2] * tiles[index][3]
+            if count % max(1, len(jobs) // 20) == 0 or count == len(jobs):
+                elapsed = time.perf_counter() - start
+                print(
+                    f"[Tiles] {len(done) + count}/{len(tiles)} tiles, "
+                    f"{rendered / elapsed / 1e6:.3f} Mpixel/s"
+                )
+
+
+def main(scene, description):
+    """Command line entry point shared by the poster scripts."""
+    parser = argparse.ArgumentParser(description=description)
+    parser.add_argument("output", help="output .ppm file (resumed if it exists)")
+    parser.add_argument("--width", type=int, default=16384)
+    parser.add_argument("--height", type=int, default=16384)
+    parser.add_argument("--time", type=float, default=0.0, help="animation time")
+    parser.add_argument("--tile-size", type=int, default=512)
+    parser.add_argument("--workers", type=int, help="default: one per core")
+    parser.add_argument("--threads-per-worker", type=int, default=1)
+    args = parser.parse_args()
+    render_tiled(
+        args.output,
+        scene,
+        args.width,
+        args.height,
+        args=(args.time,),
+        tile_size=args.tile_size,
+        workers=args.workers,
+        threads_per_worker=args.threads_per_worker,
+    )
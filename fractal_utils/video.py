@@ -0,0 +1,166 @@
+"""Streaming video output for the scene loops.
+
+Frames are copied into a small pool of reusable NumPy buffers and handed to
+a background thread, which encodes them while the next frame renders. Taichi
+fields are converted to RGB8 by a kernel; NumPy arrays and GUI canvases are
+copied as they are and converted on the encoder thread, so the render
+thread only pays for one copy. The
+thread writes Y4M (or raw RGB24 for ``.rgb`` files) to a file, or pipes Y4M
+into a locally installed ``ffmpeg`` for any other extension. When every
+buffer is in flight, ``write()`` blocks until the encoder catches up, so the
+queue depth bounds memory and latency.
+
+Recording is off unless the ``VIDEO`` environment variable names an output:
+
+    VIDEO=julia.mp4 python 2d_fractals/julia_set.py
+"""
+
+import atexit
+import os
+import queue
+import subprocess
+import threading
+import time
+
+import numpy as np
+import taichi as ti
+
+# BT.601 limited-range RGB -> YCbCr, as expected by Y4M consumers
+_YUV_MATRIX = np.array(
+    [
+        [65.481, 128.553, 24.966],
+        [-37.797, -74.203, 112.0],
+        [112.0, -93.786, -18.214],
+    ],
+    dtype=np.float32,
+) / 255.0
+_YUV_OFFSET = np.array([16.0, 128.0, 128.0], dtype=np.float32)
+
+
+@ti.kernel
+def _field_to_rgb8(src: ti.template(), dst: ti.types.ndarray(), vector: ti.template()):
+    height = dst.shape[0]
+    for i, j in src:
+        col = ti.Vector([0.0, 0.0, 0.0])
+        if ti.static(vector):
+            for c in ti.static(range(3)):
+                col[c] = src[i, j][c]
+        else:
+            col = ti.Vector([1.0, 1.0, 1.0]) * src[i, j]
+        col = ti.math.clamp(col * 255.0 + 0.5, 0.0, 255.0)
+        for c in ti.static(range(3)):
+            dst[height - 1 - j, i, c] = ti.cast(col[c], ti.u8)
+
+
+class VideoWriter:
+    """Encode frames on a background thread with bounded queue depth."""
+
+    def __init__(self, target, width, height, fps=30, queue_depth=3, command=None):
+        self.enabled = target is not None
+        self.width, self.height, self.fps = width, height, fps
+        self.frames = 0
+        self.blocked = 0.0  # seconds write() spent waiting on the encoder
+        self.spent = 0.0  # seconds write() took on the caller's thread in total
+        if not self.enabled:
+            return
+
+        self.raw_rgb = target.endswith(".rgb")
+        self._process = None
+        if command is not None or not target.endswith((".y4m", ".rgb")):
+            command = command or [
+                "ffmpeg", "-y", "-loglevel", "error", "-f", "yuv4mpegpipe",
+                "-i", "-", "-pix_fmt", "yuv420p", target,
+            ]
+            self._process = subprocess.Popen(command, stdin=subprocess.PIPE)
+            self._out = self._process.stdin
+        else:
+            self._out = open(target, "wb")
+        if not self.raw_rgb:
+            self._out.write(
+                f"YUV4MPEG2 W{width} H{height} F{fps}:1 Ip A1:1 C444\n".encode("ascii")
+            )
+
+        # Each slot holds an RGB8 frame and a staging copy of array input
+        self._free = queue.Queue()
+        for _ in range(queue_depth):
+            self._free.put([np.empty((height, width, 3), dtype=np.uint8), None])
+        self._full = queue.Queue()
+        self._error = None
+        self._thread = threading.Thread(target=self._encode, daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    @classmethod
+    def from_env(cls, width, height, fps=30, **kwargs):
+        return cls(os.environ.get("VIDEO") or None, width, height, fps, **kwargs)
+
+    def write(self, frame):
+        """Queue a frame: a scalar or RGB Taichi field, a ``(w, h, c)`` array
+        indexed ``[x, y]`` with y up, or a ``ti.GUI`` whose canvas to capture
+        (call before ``gui.show()``, which clears it)."""
+        if not self.enabled:
+            return
+        if self._error is not None:
+            raise self._error
+        start = time.perf_counter()
+        slot = self._free.get()  # back-pressure when the encoder lags
+        self.blocked += time.perf_counter() - start
+        if isinstance(frame, ti.GUI):
+            frame = frame.get_image()
+        if isinstance(frame, np.ndarray):
+            staging = slot[1]
+            if staging is None or staging.shape != frame.shape or staging.dtype != frame.dtype:
+                staging = slot[1] = np.empty_like(frame)
+            np.copyto(staging, frame)
+            self._full.put((slot, True))
+        else:
+            _field_to_rgb8(frame, slot[0], isinstance(frame, ti.MatrixField))
+            self._full.put((slot, False))
+        self.frames += 1
+        self.spent += time.perf_counter() - start
+
+    def close(self):
+        if not self.enabled:
+            return
+        self.enabled = False
+        self._full.put(None)
+        self._thread.join()
+        self._out.close()
+        if self._process is not None:
+            self._process.wait()
+        per_frame = self.spent / max(self.frames, 1) * 1000.0
+        print(
+            f"[Video] {self.frames} frames, {per_frame:.2f} ms per frame in write() "
+            f"({self.blocked:.2f} s of it waiting on the encoder)"
+        )
+
+    @staticmethod
+    def _array_to_rgb8(frame, buffer):
+        # (w, h, c) indexed [x, y] with y up -> image rows top to bottom
+        if frame.ndim == 3:
+            rgb = frame[:, ::-1, :3].transpose(1, 0, 2)
+        else:
+            rgb = frame[:, ::-1].T[:, :, None]
+        np.copyto(buffer, np.clip(rgb * 255.0 + 0.5, 0.0, 255.0), casting="unsafe")
+
+    def _encode(self):
+        while True:
+            item = self._full.get()
+            if item is None:
+                return
+            slot, staged = item
+            buffer = slot[0]
+            try:
+                if staged:
+                    self._array_to_rgb8(slot[1], buffer)
+                if self.raw_rgb:
+                    self._out.write(buffer.data)
+                else:
+                    yuv = buffer.reshape(-1, 3) @ _YUV_MATRIX.T + _YUV_OFFSET
+                    planes = np.clip(yuv + 0.5, 0, 255).astype(np.uint8).T
+                    self._out.write(b"FRAME\n")
+                    self._out.write(np.ascontiguousarray(planes).data)
+            except Exception as e:  # surfaced on the next write()
+                self._error = e
+            finally:
+                self._free.put(slot)
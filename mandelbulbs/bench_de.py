@@ -0,0 +1,46 @@
+import time
+
+import taichi as ti
+import taichi.math as tm
+
+from mandelbulb_white import ITERATIONS, mandelbulb_de
+
+# Microbenchmark for the Mandelbulb distance estimator: DE evaluations/sec
+# for the trigonometric and trig-free variants.
+N_POINTS = 1 << 20
+REPEATS = 10
+
+points = ti.Vector.field(3, dtype=ti.f32, shape=N_POINTS)
+distances = ti.field(dtype=ti.f32, shape=N_POINTS)
+
+@ti.kernel
+def scatter_points():
+    for i in points:
+        points[i] = 1.2 * (2.0 * tm.vec3(ti.random(), ti.random(), ti.random()) - 1.0)
+
+@ti.kernel
+def evaluate(power: ti.template(), julia: ti.template(), trig_free: ti.template()):
+    for i in points:
+        distances[i] = mandelbulb_de(points[i], power, ITERATIONS, julia, trig_free)
+
+def benchmark(power, julia, trig_free):
+    evaluate(power, julia, trig_free)  # compile and warm up
+    ti.sync()
+    start = time.perf_counter()
+    for _ in range(REPEATS):
+        evaluate(power, julia, trig_free)
+    ti.sync()
+    return N_POINTS * REPEATS / (time.perf_counter() - start)
+
+def main():
+    scatter_points()
+    for power, julia in [(8, False), (8, True), (3, False)]:
+        trig = benchmark(power, julia, False)
+        fast = benchmark(power, julia, True)
+        label = f"power {power}{' julia' if julia else ''}"
+        print(f"{label:>14}: trig {trig / 1e6:8.2f} M DE/s, "
+              f"trig-free {fast / 1e6:8.2f} M DE/s ({fast / trig:.2f}x)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,11 @@
+# Render a frame of the white Mandelbulb as a print-resolution poster, e.g.
+#   python mandelbulbs/mandelbulb_poster.py poster.ppm --width 16384 --height 12288
+import os
+import sys
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fractal_utils import tiles
+
+if __name__ == "__main__":
+    tiles.main("mandelbulb_white:render_tile", "Tiled Mandelbulb poster")
@@ -1,10 +1,16 @@
 # C++ reference and tutorial (Chinese): https://zhuanlan.zhihu.com/p/26882619
 import math
+import os
+import sys
 
 import numpy as np
 
 import taichi as ti
 
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from fractal_utils.telemetry import Telemetry  # noqa: E402
+from fractal_utils.video import VideoWriter  # noqa: E402
+
 ti.init(arch=ti.gpu)
 
 eps = 0.01
@@ -78,19 +84,27 @@ def init_tracers():
 def main():
     init_tracers()
     gui = ti.GUI("Vortex Rings", (1820, 1000), background_color=0xFFFFFF)
+    telemetry = Telemetry.from_env(kernels=[advect, integrate_vortex])
+    video = VideoWriter.from_env(*gui.res)
 
     while gui.running:
-        for i in range(4):  # substeps
-            advect()
-            integrate_vortex()
-
-        gui.circles(
-            tracer.to_numpy() * np.array([[0.05, 0.1]]) + np.array([[0.0, 0.5]]),
-            radius=0.5,
-            color=0x0,
-        )
-
-        gui.show()
+        with telemetry.scope("advect"):
+            for i in range(4):  # substeps
+                advect()
+                integrate_vortex()
+
+        with telemetry.scope("to_numpy"):
+            tracers = tracer.to_numpy()
+        with telemetry.scope("show"):
+            gui.circles(
+                tracers * np.array([[0.05, 0.1]]) + np.array([[0.0, 0.5]]),
+                radius=0.5,
+                color=0x0,
+            )
+            video.write(gui)
+            telemetry.overlay(gui, color=0x000000)
+            gui.show()
+        telemetry.frame()
 
 
 if __name__ == "__main__":